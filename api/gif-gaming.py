@@ -8,6 +8,91 @@ import io
 import base64
 import json
 import math
+import time
+
+# maxBytes探索: 品質の高い順の (フレーム間引き, パレット色数)
+MAX_BYTES_SEARCH_LEVELS = [(1, 256), (1, 128), (1, 64), (2, 64), (2, 32), (3, 32)]
+MAX_BYTES_MIN_SCALE = 0.5  # 最終段階以外で許容する最小縮小率
+MAX_BYTES_MIN_SCALE_FLOOR = 0.1  # 最終段階で許容する最小縮小率
+MAX_BYTES_SCALE_SEARCH_STEPS = 5  # 縮小率の二分探索回数
+
+class CompositingEngine:
+    """エフェクト合成エンジン（リクエスト単位でバッファを再利用し、フレームへインプレース合成）"""
+    
+    # アルファ値からエフェクトマスクへの変換テーブル（透過部分は0、それ以外は80%の強度で静止画と統一）
+    EFFECT_MASK_LUT = [0] + [int(255 * 0.8)] * 255
+    
+    def __init__(self, size):
+        self.size = size
+        self.overlay = None
+        self.draw = None
+        self.opaque_mask = None
+        self.allocations = 0
+        self.frames = 0
+        self.total_time = 0.0
+        self.max_frame_time = 0.0
+        self.pending_time = 0.0
+        self.last_frame_time = 0.0
+        self.last_frame_allocations = 0
+    
+    def acquire_overlay(self, size):
+        """クリア済みのオーバーレイバッファと描画コンテキストを取得"""
+        started = time.perf_counter()
+        if self.overlay is None or self.overlay.size != size:
+            self.size = size
+            self.overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+            self.draw = ImageDraw.Draw(self.overlay)
+            self.allocations += 1
+        else:
+            self.overlay.paste((0, 0, 0, 0), (0, 0, *size))
+        self.pending_time += time.perf_counter() - started
+        return self.overlay, self.draw
+    
+    def composite(self, frame):
+        """オーバーレイをフレームにインプレースでブレンド（Image.compositeと同じ結果）"""
+        started = time.perf_counter()
+        allocations = 0
+        
+        try:
+            # エフェクトマスクをアルファチャンネルから生成（透過部分を除外）
+            if frame.mode == 'RGBA':
+                effect_mask = frame.getchannel('A').point(self.EFFECT_MASK_LUT)
+                allocations += 2
+            else:
+                if self.opaque_mask is None or self.opaque_mask.size != frame.size:
+                    self.opaque_mask = Image.new('L', frame.size, self.EFFECT_MASK_LUT[255])
+                    allocations += 1
+                effect_mask = self.opaque_mask
+            
+            frame.paste(self.overlay, (0, 0), effect_mask)
+            result = frame
+            
+        except Exception as e:
+            print(f"⚠️ 高速合成失敗、フォールバックします: {e}")
+            # フォールバック: シンプルなアルファブレンド
+            result = Image.alpha_composite(frame, self.overlay)
+            allocations += 1
+        
+        frame_time = self.pending_time + time.perf_counter() - started
+        self.pending_time = 0.0
+        self.allocations += allocations
+        self.frames += 1
+        self.total_time += frame_time
+        self.max_frame_time = max(self.max_frame_time, frame_time)
+        self.last_frame_time = frame_time
+        self.last_frame_allocations = allocations
+        return result
+    
+    def stats(self):
+        """計測結果（合成時間・アロケーション数）"""
+        return {
+            'frames': self.frames,
+            'allocations': self.allocations,
+            'allocationsPerFrame': round(self.allocations / self.frames, 2) if self.frames else 0,
+            'totalMs': round(self.total_time * 1000, 3),
+            'avgMsPerFrame': round(self.total_time * 1000 / self.frames, 3) if self.frames else 0,
+            'maxMsPerFrame': round(self.max_frame_time * 1000, 3)
+        }
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -49,6 +134,13 @@ class handler(BaseHTTPRequestHandler):
 
             print("📊 設定:", settings)
             
+            # 出力サイズ上限（バイト）
+            max_bytes = settings.get('maxBytes')
+            if max_bytes is not None and (isinstance(max_bytes, bool) or not isinstance(max_bytes, int) or max_bytes <= 0):
+                error_response = {'error': 'maxBytesは正の整数で指定してください', 'details': str(max_bytes)}
+                self.send_error_response(error_response, 400)
+                return
+            
             # Base64デコード
             if gif_data.startswith('data:'):
                 gif_data = gif_data.split(',')[1]
@@ -137,6 +229,9 @@ class handler(BaseHTTPRequestHandler):
             canvas_height = settings.get('canvasHeight', 600)
             print(f"📐 出力サイズ: {canvas_width}x{canvas_height}")
             
+            # 合成バッファはリクエスト内の全フレームで再利用
+            compositor = CompositingEngine((canvas_width, canvas_height))
+            
             for i, frame in enumerate(frames):
                 # フレーム進行度を0-1の範囲で計算（完全同期）
                 frame_progress = i / effect_cycle_frames if effect_cycle_frames > 1 else 0
@@ -144,30 +239,30 @@ class handler(BaseHTTPRequestHandler):
                 # フレームをキャンバスサイズにリサイズ
                 resized_frame = self.resize_frame_to_canvas(frame, canvas_width, canvas_height)
                 
-                processed_frame = self.apply_gaming_effect(resized_frame, i, len(frames), settings, frame_progress)
+                processed_frame = self.apply_gaming_effect(resized_frame, i, len(frames), settings, frame_progress, compositor)
                 processed_frames.append(processed_frame)
                 if i < 5 or i % 5 == 0:
                     print(f"✅ フレーム {i + 1}/{len(frames)} 完了 (進行度: {frame_progress:.2f}, サイズ: {processed_frame.size})")
+                    if compositor.frames:
+                        print(f"🧩 合成: {compositor.last_frame_time * 1000:.2f}ms, アロケーション {compositor.last_frame_allocations}")
+            
+            compositing_stats = compositor.stats()
+            if compositing_stats['frames']:
+                print(f"🧩 合成統計: {compositing_stats}")
             
             # GIF保存
             print("💾 GIF生成中...")
-            output_buffer = io.BytesIO()
-            
-            # 最初のフレームでGIFを初期化
-            processed_frames[0].save(
-                output_buffer,
-                format='GIF',
-                save_all=True,
-                append_images=processed_frames[1:],
-                duration=durations,
-                loop=0,
-                optimize=False,
-                disposal=2
-            )
+            size_optimization = None
+            
+            if max_bytes is not None:
+                # レンダリング済みフレームを再利用して出力パラメータを探索
+                output_bytes, size_optimization = self.search_max_bytes(processed_frames, durations, max_bytes)
+                output_frame_count = size_optimization['frameCount']
+            else:
+                output_bytes = self.encode_gif(processed_frames, durations)
+                output_frame_count = len(frames)
             
             # 結果をBase64エンコード
-            output_buffer.seek(0)
-            output_bytes = output_buffer.getvalue()
             output_base64 = base64.b64encode(output_bytes).decode('utf-8')
             
             print("🎉 GIF生成完了")
@@ -176,9 +271,13 @@ class handler(BaseHTTPRequestHandler):
             response = {
                 'success': True,
                 'gifData': f'data:image/gif;base64,{output_base64}',
-                'frameCount': len(frames),
+                'frameCount': output_frame_count,
                 'size': len(output_bytes)
             }
+            if size_optimization is not None:
+                response['sizeOptimization'] = size_optimization
+            if compositing_stats['frames']:
+                response['compositing'] = compositing_stats
             
             self.send_success_response(response)
             
@@ -265,8 +364,117 @@ class handler(BaseHTTPRequestHandler):
         
         return frames, durations
     
-    def apply_gaming_effect(self, frame, frame_index, total_frames, settings, frame_progress=None):
-        """ゲーミング効果をフレームに適用（透過部分を除く、フレーム同期）"""
+    def encode_gif(self, frames, durations, scale=1.0, frame_step=1, colors=256):
+        """フレームをGIFにエンコード（縮小率・フレーム間引き・パレット色数を指定可能）"""
+        # フレーム間引き: 間引いたフレームの表示時間は残すフレームに加算
+        if frame_step > 1:
+            output_frames = frames[::frame_step]
+            output_durations = [
+                sum(durations[i:i + frame_step]) for i in range(0, len(durations), frame_step)
+            ]
+        else:
+            output_frames = frames
+            output_durations = durations
+        
+        # 縮小
+        if scale < 1.0:
+            width, height = output_frames[0].size
+            scaled_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            output_frames = [frame.resize(scaled_size, Image.Resampling.LANCZOS) for frame in output_frames]
+        
+        # パレット色数の削減（透過色はパレットのアルファから復元）
+        if colors < 256:
+            quantized_frames = []
+            for frame in output_frames:
+                quantized = frame.convert('P', palette=Image.Palette.ADAPTIVE, colors=colors)
+                if quantized.palette.mode == 'RGBA':
+                    for rgba, index in quantized.palette.colors.items():
+                        if rgba[3] == 0:
+                            quantized.info['transparency'] = index
+                            break
+                quantized_frames.append(quantized)
+            output_frames = quantized_frames
+        
+        output_buffer = io.BytesIO()
+        output_frames[0].save(
+            output_buffer,
+            format='GIF',
+            save_all=True,
+            append_images=output_frames[1:],
+            duration=output_durations,
+            loop=0,
+            optimize=False,
+            disposal=2
+        )
+        return output_buffer.getvalue()
+    
+    def search_max_bytes(self, frames, durations, max_bytes):
+        """maxBytes以下に収まる出力パラメータを探索（レンダリング済みフレームを再利用）"""
+        attempts = 0
+        smallest = None
+        
+        def encode(scale, frame_step, colors):
+            nonlocal attempts, smallest
+            attempts += 1
+            data = self.encode_gif(frames, durations, scale, frame_step, colors)
+            params = {'scale': scale, 'frameStep': frame_step, 'colors': colors}
+            print(f"🔎 エンコード試行 {attempts}: {params} -> {len(data)} bytes")
+            if smallest is None or len(data) < len(smallest[0]):
+                smallest = (data, params)
+            return data
+        
+        def result(data, scale, frame_step, colors, satisfied):
+            width, height = frames[0].size
+            return data, {
+                'maxBytes': max_bytes,
+                'satisfied': satisfied,
+                'scale': round(scale, 4),
+                'width': max(1, round(width * scale)),
+                'height': max(1, round(height * scale)),
+                'frameStep': frame_step,
+                'frameCount': len(frames[::frame_step]),
+                'colors': colors,
+                'encodeAttempts': attempts
+            }
+        
+        # 品質の高い順に (フレーム間引き, パレット色数) を試し、各段階で縮小率を二分探索
+        levels = []
+        for frame_step, colors in MAX_BYTES_SEARCH_LEVELS:
+            frame_step = min(frame_step, len(frames))
+            if (frame_step, colors) not in levels:
+                levels.append((frame_step, colors))
+        
+        for level_index, (frame_step, colors) in enumerate(levels):
+            data = encode(1.0, frame_step, colors)
+            if len(data) <= max_bytes:
+                return result(data, 1.0, frame_step, colors, True)
+            
+            is_last_level = level_index == len(levels) - 1
+            low = MAX_BYTES_MIN_SCALE_FLOOR if is_last_level else MAX_BYTES_MIN_SCALE
+            data = encode(low, frame_step, colors)
+            if len(data) > max_bytes:
+                continue
+            
+            fit_scale, fit_data, high = low, data, 1.0
+            for _ in range(MAX_BYTES_SCALE_SEARCH_STEPS):
+                middle = (low + high) / 2
+                data = encode(middle, frame_step, colors)
+                if len(data) <= max_bytes:
+                    low, fit_scale, fit_data = middle, middle, data
+                else:
+                    high = middle
+            return result(fit_data, fit_scale, frame_step, colors, True)
+        
+        # どの設定でも収まらない場合は最小の結果を返す
+        print(f"⚠️ maxBytes={max_bytes} に収まりませんでした")
+        data, params = smallest
+        return result(data, params['scale'], params['frameStep'], params['colors'], False)
+    
+    def apply_gaming_effect(self, frame, frame_index, total_frames, settings, frame_progress=None, compositor=None):
+        """ゲーミング効果をフレームに適用（透過部分を除く、フレーム同期）
+        
+        rainbow以外のエフェクトは compositor のバッファを使い、frame にインプレースで合成する。
+        """
         animation_type = settings.get('animationType', 'rainbow')
         speed = settings.get('speed', 5)
         saturation = settings.get('saturation', 100)
@@ -280,13 +488,14 @@ class handler(BaseHTTPRequestHandler):
             # 従来の方式（フォールバック）
             progress = (frame_index / total_frames) * speed
         
-        # 結果画像を作成
-        result = Image.new('RGBA', frame.size)
         width, height = frame.size
         
-        # 高速化: エフェクトオーバーレイを作成してアルファブレンド
-        overlay = Image.new('RGBA', frame.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
+        # 高速化: 再利用バッファのエフェクトオーバーレイに描画してアルファブレンド
+        # （rainbowはピクセルを直接処理するためオーバーレイ不要）
+        if compositor is None:
+            compositor = CompositingEngine(frame.size)
+        if animation_type != 'rainbow':
+            overlay, draw = compositor.acquire_overlay(frame.size)
         
         # エフェクト別の描画
         if animation_type == 'rainbow':
@@ -446,35 +655,8 @@ class handler(BaseHTTPRequestHandler):
             
             overlay.putdata(overlay_pixels)
         
-        # 高速アルファブレンド
-        try:
-            # フレームとマスクを作成
-            frame_mask = Image.new('L', frame.size, 0)
-            if frame.mode == 'RGBA':
-                frame_mask = frame.split()[3]  # アルファチャンネル
-            else:
-                frame_mask = Image.new('L', frame.size, 255)  # 完全不透明
-                
-            # エフェクトマスクを作成（透過部分を除外）
-            effect_mask = Image.new('L', frame.size, 0)
-            effect_pixels = []
-            for i, pixel in enumerate(frame.getdata()):
-                if len(pixel) == 4 and pixel[3] == 0:
-                    effect_pixels.append(0)  # 透過部分は効果なし
-                else:
-                    effect_pixels.append(int(255 * 0.8))  # 80%の強度（静止画と統一）
-            effect_mask.putdata(effect_pixels)
-            
-            # 最終合成
-            result = Image.composite(overlay, frame, effect_mask)
-            return result
-            
-        except Exception as e:
-            print(f"⚠️ 高速合成失敗、フォールバックします: {e}")
-            # フォールバック: シンプルなアルファブレンド
-            return Image.alpha_composite(frame, overlay)
-        
-        return result
+        # 高速アルファブレンド（インプレース）
+        return compositor.composite(frame)
     
     def get_rainbow_color(self, x, y, width, height, progress, saturation):
         """虹色エフェクト計算（フレーム同期）"""
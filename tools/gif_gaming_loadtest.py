@@ -0,0 +1,410 @@
+"""
+GIF Gaming API 負荷テストツール
+
+api/gif-gaming.py の handler をローカルの ThreadingHTTPServer / ForkingHTTPServer で起動し、
+GIFサイズ・フレーム数・animationType を混ぜたリクエストを指定した並列度で送信する。
+スループット・レイテンシ (p50/p95/p99)・エラー率・ワーカー毎のピークRSSを計測し、
+JSONレポートとして保存する（--compare で過去のレポートと比較可能）。
+
+使い方:
+    python3 tools/gif_gaming_loadtest.py --concurrency 4 --requests 40
+    python3 tools/gif_gaming_loadtest.py --mode forking --sizes 64,128 --frames 1,10
+    python3 tools/gif_gaming_loadtest.py --compare reports/loadtest/20250701_120000_loadtest_threading.json
+"""
+
+import argparse
+import base64
+import datetime
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, ThreadingHTTPServer
+
+from PIL import Image, ImageDraw
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLER_PATH = os.path.join(REPO_ROOT, 'api', 'gif-gaming.py')
+DEFAULT_REPORT_DIR = os.path.join(REPO_ROOT, 'reports', 'loadtest')
+
+ANIMATION_TYPES = ['rainbow', 'golden', 'bluepurplepink', 'rainbowPulse', 'concentration', 'pulse']
+
+
+def load_handler_class():
+    """api/gif-gaming.py から handler クラスを読み込む（ファイル名にハイフンを含むため importlib を使用）"""
+    spec = importlib.util.spec_from_file_location('gif_gaming', HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+def current_peak_rss_kb():
+    """現在のプロセスのピークRSS（KB）を取得"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト単位、LinuxはKB単位
+    if sys.platform == 'darwin':
+        return max_rss // 1024
+    return max_rss
+
+
+class RssRecordingMixin:
+    """リクエスト処理後にワーカー（プロセス）のピークRSSをログファイルへ追記する"""
+    rss_log_path = None
+    rss_log_lock = threading.Lock()
+
+    def finish_request(self, request, client_address):
+        try:
+            super().finish_request(request, client_address)
+        finally:
+            self.record_rss()
+
+    def record_rss(self):
+        if not self.rss_log_path:
+            return
+        line = json.dumps({
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'peakRssKb': current_peak_rss_kb()
+        }) + '\n'
+        # フォーク先の子プロセスからも書き込むため、1行ずつ追記モードで書き込む
+        with self.rss_log_lock:
+            with open(self.rss_log_path, 'a') as rss_log:
+                rss_log.write(line)
+
+
+class ThreadingLoadTestServer(RssRecordingMixin, ThreadingHTTPServer):
+    pass
+
+
+class ForkingLoadTestServer(RssRecordingMixin, socketserver.ForkingMixIn, HTTPServer):
+    pass
+
+
+SERVER_CLASSES = {
+    'threading': ThreadingLoadTestServer,
+    'forking': ForkingLoadTestServer
+}
+
+
+def serve(mode, rss_log_path, max_children, verbose, port_queue):
+    """サーバープロセスのエントリーポイント"""
+    if not verbose:
+        # handler の print とアクセスログを抑制
+        devnull = open(os.devnull, 'w')
+        sys.stdout = devnull
+        sys.stderr = devnull
+
+    handler_class = load_handler_class()
+    server_class = SERVER_CLASSES[mode]
+    server_class.rss_log_path = rss_log_path
+    if mode == 'forking':
+        server_class.max_children = max_children
+
+    server = server_class(('127.0.0.1', 0), handler_class)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def make_test_gif(size, frame_count):
+    """透過背景上を円が移動するテスト用GIFを生成"""
+    frames = []
+    for i in range(frame_count):
+        frame = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(frame)
+        radius = max(2, size // 4)
+        offset = int((size - radius * 2) * (i / max(1, frame_count - 1)))
+        draw.ellipse([offset, size // 4, offset + radius * 2, size // 4 + radius * 2], fill=(220, 60, 60, 255))
+        draw.rectangle([0, size - size // 8, size - 1, size - 1], fill=(40, 40, 200, 255))
+        frames.append(frame)
+
+    buffer = io.BytesIO()
+    frames[0].save(
+        buffer,
+        format='GIF',
+        save_all=True,
+        append_images=frames[1:],
+        duration=100,
+        loop=0,
+        disposal=2
+    )
+    return 'data:image/gif;base64,' + base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def build_scenarios(sizes, frame_counts, animation_types):
+    """GIFサイズ × フレーム数 × animationType の組み合わせごとにリクエストボディを作成"""
+    scenarios = []
+    for size in sizes:
+        for frame_count in frame_counts:
+            gif_data = make_test_gif(size, frame_count)
+            for animation_type in animation_types:
+                body = json.dumps({
+                    'gifData': gif_data,
+                    'settings': {
+                        'animationType': animation_type,
+                        'canvasWidth': size,
+                        'canvasHeight': size
+                    }
+                }).encode('utf-8')
+                scenarios.append({
+                    'key': f'{size}px/{frame_count}f/{animation_type}',
+                    'size': size,
+                    'frames': frame_count,
+                    'animationType': animation_type,
+                    'body': body
+                })
+    return scenarios
+
+
+def send_request(url, scenario, timeout):
+    """1リクエストを送信して結果を返す"""
+    started = time.perf_counter()
+    result = {'scenario': scenario['key'], 'status': None, 'error': None, 'responseBytes': 0}
+    try:
+        request = urllib.request.Request(
+            url,
+            data=scenario['body'],
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = response.read()
+            result['status'] = response.status
+            result['responseBytes'] = len(payload)
+            if not json.loads(payload).get('success'):
+                result['error'] = 'success=false'
+    except urllib.error.HTTPError as error:
+        result['status'] = error.code
+        result['error'] = f'HTTP {error.code}'
+    except Exception as error:
+        result['error'] = f'{type(error).__name__}: {error}'
+    result['latencyMs'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def percentile(sorted_values, percent):
+    """線形補間によるパーセンタイル計算"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+
+def summarize_latencies(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {}
+    return {
+        'min': round(values[0], 2),
+        'mean': round(sum(values) / len(values), 2),
+        'p50': round(percentile(values, 50), 2),
+        'p95': round(percentile(values, 95), 2),
+        'p99': round(percentile(values, 99), 2),
+        'max': round(values[-1], 2)
+    }
+
+
+def summarize_workers(rss_log_path):
+    """RSSログからワーカー（PID）毎の処理数とピークRSSを集計"""
+    workers = {}
+    if not os.path.exists(rss_log_path):
+        return []
+    with open(rss_log_path) as rss_log:
+        for line in rss_log:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            worker = workers.setdefault(entry['pid'], {'pid': entry['pid'], 'requestsHandled': 0, 'peakRssKb': 0})
+            worker['requestsHandled'] += 1
+            worker['peakRssKb'] = max(worker['peakRssKb'], entry['peakRssKb'])
+    return sorted(workers.values(), key=lambda worker: worker['pid'])
+
+
+def git_info():
+    """レポート比較用に現在のコミット情報を取得"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except Exception:
+        return {'commit': None, 'dirty': None}
+
+
+def run_load_test(args):
+    sizes = [int(value) for value in args.sizes.split(',')]
+    frame_counts = [int(value) for value in args.frames.split(',')]
+    animation_types = args.animation_types.split(',')
+
+    print(f"🧪 シナリオ生成中: sizes={sizes}, frames={frame_counts}, animationTypes={animation_types}")
+    scenarios = build_scenarios(sizes, frame_counts, animation_types)
+    rng = random.Random(args.seed)
+    schedule = [rng.choice(scenarios) for _ in range(args.requests)]
+
+    rss_log_fd, rss_log_path = tempfile.mkstemp(prefix='loadtest_rss_', suffix='.jsonl')
+    os.close(rss_log_fd)
+
+    context = multiprocessing.get_context('fork' if args.mode == 'forking' else None)
+    port_queue = context.Queue()
+    server_process = context.Process(
+        target=serve,
+        args=(args.mode, rss_log_path, max(args.concurrency, 1), args.verbose, port_queue),
+        daemon=True
+    )
+    server_process.start()
+
+    try:
+        port = port_queue.get(timeout=30)
+        url = f'http://127.0.0.1:{port}/api/gif-gaming.py'
+        print(f"🚀 サーバー起動: mode={args.mode}, {url}")
+        print(f"📊 {args.requests} リクエスト / 並列度 {args.concurrency}")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(lambda scenario: send_request(url, scenario, args.timeout), schedule))
+        wall_time = time.perf_counter() - started
+    finally:
+        server_process.terminate()
+        server_process.join(timeout=10)
+
+    # フォークされた子プロセスのログ書き込み完了を待つ
+    time.sleep(0.2)
+    workers = summarize_workers(rss_log_path)
+    if os.path.exists(rss_log_path):
+        os.remove(rss_log_path)
+
+    failed = [result for result in results if result['error']]
+    succeeded_latencies = [result['latencyMs'] for result in results if not result['error']]
+
+    scenario_stats = {}
+    for result in results:
+        stats = scenario_stats.setdefault(result['scenario'], {'requests': 0, 'errors': 0, 'latencies': []})
+        stats['requests'] += 1
+        if result['error']:
+            stats['errors'] += 1
+        else:
+            stats['latencies'].append(result['latencyMs'])
+
+    return {
+        'tool': 'gif_gaming_loadtest',
+        'createdAt': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git': git_info(),
+        'config': {
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'sizes': sizes,
+            'frames': frame_counts,
+            'animationTypes': animation_types,
+            'timeoutSec': args.timeout,
+            'seed': args.seed,
+            'python': sys.version.split()[0],
+            'cpuCount': os.cpu_count()
+        },
+        'summary': {
+            'requests': len(results),
+            'succeeded': len(results) - len(failed),
+            'failed': len(failed),
+            'errorRate': round(len(failed) / len(results), 4) if results else 0,
+            'wallTimeSec': round(wall_time, 3),
+            'throughputRps': round(len(results) / wall_time, 3) if wall_time > 0 else None,
+            'latencyMs': summarize_latencies(succeeded_latencies),
+            'maxPeakRssKb': max((worker['peakRssKb'] for worker in workers), default=None)
+        },
+        'scenarios': {
+            key: {
+                'requests': stats['requests'],
+                'errors': stats['errors'],
+                'latencyMs': summarize_latencies(stats['latencies'])
+            }
+            for key, stats in sorted(scenario_stats.items())
+        },
+        'workers': workers,
+        'errors': [{'scenario': result['scenario'], 'error': result['error']} for result in failed[:20]]
+    }
+
+
+def print_report(report):
+    summary = report['summary']
+    latency = summary['latencyMs']
+    print("🎉 負荷テスト完了")
+    print(f"⏱️ 実行時間: {summary['wallTimeSec']}s, スループット: {summary['throughputRps']} req/s")
+    print(f"📈 レイテンシ(ms): p50={latency.get('p50')}, p95={latency.get('p95')}, p99={latency.get('p99')}, max={latency.get('max')}")
+    print(f"❌ エラー率: {summary['errorRate'] * 100:.2f}% ({summary['failed']}/{summary['requests']})")
+    for worker in report['workers']:
+        print(f"👷 ワーカー pid={worker['pid']}: {worker['requestsHandled']} リクエスト, ピークRSS {worker['peakRssKb'] / 1024:.1f}MB")
+
+
+def print_comparison(report, baseline):
+    """基準レポートとの差分を表示"""
+    def delta(label, current, previous, unit):
+        if current is None or previous is None:
+            print(f"  {label}: {previous} -> {current}")
+            return
+        change = ((current - previous) / previous * 100) if previous else 0
+        print(f"  {label}: {previous}{unit} -> {current}{unit} ({change:+.1f}%)")
+
+    current, previous = report['summary'], baseline['summary']
+    print(f"🔁 比較: {baseline['git'].get('commit')} ({baseline['createdAt']}) -> {report['git'].get('commit')}")
+    delta('throughput', current['throughputRps'], previous['throughputRps'], ' req/s')
+    for key in ('p50', 'p95', 'p99'):
+        delta(f'latency {key}', current['latencyMs'].get(key), previous['latencyMs'].get(key), 'ms')
+    delta('error rate', current['errorRate'], previous['errorRate'], '')
+    delta('max peak RSS', current['maxPeakRssKb'], previous['maxPeakRssKb'], 'KB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GIF Gaming API 負荷テスト')
+    parser.add_argument('--mode', choices=sorted(SERVER_CLASSES), default='threading', help='ローカルサーバーの並行処理方式')
+    parser.add_argument('--concurrency', type=int, default=4, help='同時リクエスト数')
+    parser.add_argument('--requests', type=int, default=40, help='総リクエスト数')
+    parser.add_argument('--sizes', default='64,128,256', help='GIFサイズ（px, カンマ区切り）')
+    parser.add_argument('--frames', default='1,8,24', help='フレーム数（カンマ区切り）')
+    parser.add_argument('--animation-types', default=','.join(ANIMATION_TYPES), help='animationType（カンマ区切り）')
+    parser.add_argument('--timeout', type=float, default=300, help='リクエストタイムアウト（秒）')
+    parser.add_argument('--seed', type=int, default=0, help='シナリオ選択の乱数シード')
+    parser.add_argument('--output', help='レポートJSONの出力先（省略時は reports/loadtest/ に保存）')
+    parser.add_argument('--compare', help='比較対象のレポートJSON')
+    parser.add_argument('--verbose', action='store_true', help='handler のログを表示')
+    args = parser.parse_args()
+
+    if args.mode == 'forking' and not hasattr(os, 'fork'):
+        parser.error('forking モードはこのプラットフォームでは利用できません')
+
+    report = run_load_test(args)
+    print_report(report)
+
+    output_path = args.output
+    if not output_path:
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        output_path = os.path.join(DEFAULT_REPORT_DIR, f'{timestamp}_loadtest_{args.mode}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as report_file:
+        json.dump(report, report_file, indent=2, ensure_ascii=False)
+    print(f"💾 レポート保存: {output_path}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            print_comparison(report, json.load(baseline_file))
+
+
+if __name__ == '__main__':
+    main()